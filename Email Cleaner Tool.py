@@ -11,19 +11,28 @@
 ╚══════════════════════════════════════════════════════════════════╝
 """
 
+import argparse
+import getpass
+import os
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, filedialog
 import imaplib
 import email
 from email.header import decode_header
 import re
+import select
+import ssl
 import threading
 from datetime import datetime, timedelta
 from collections import defaultdict
 import json
+import csv
+import gzip
+import sqlite3
 import webbrowser
 from typing import List, Dict, Tuple, Optional
 from dataclasses import dataclass
+from abc import ABC, abstractmethod
 import time
 
 # محاولة استيراد requests
@@ -54,6 +63,708 @@ class EmailMessage:
     unsubscribe_email: Optional[str]
     is_promotional: bool
     folder: str
+    account: str = ''
+    uidvalidity: Optional[int] = None
+
+
+class SequenceSet:
+    """مجموعة أرقام رسائل مضغوطة على شكل نطاقات (sequence-set في RFC 3501)"""
+    
+    def __init__(self, ranges: Optional[List[Tuple[int, int]]] = None):
+        self.ranges: List[Tuple[int, int]] = self._merge(ranges or [])
+    
+    @staticmethod
+    def _merge(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """ترتيب النطاقات ودمج المتداخل والمتجاور منها"""
+        merged: List[Tuple[int, int]] = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+            else:
+                merged.append((start, end))
+        return merged
+    
+    @classmethod
+    def parse(cls, text) -> 'SequenceSet':
+        """تحويل نص مثل 1:5,9,12:20 إلى نطاقات"""
+        if isinstance(text, bytes):
+            text = text.decode('ascii')
+        ranges = []
+        for part in (text or '').split(','):
+            part = part.strip()
+            if not part:
+                continue
+            if ':' in part:
+                start, end = (int(n) for n in part.split(':', 1))
+                ranges.append((min(start, end), max(start, end)))
+            else:
+                ranges.append((int(part), int(part)))
+        return cls(ranges)
+    
+    @classmethod
+    def from_ids(cls, ids) -> 'SequenceSet':
+        """بناء المجموعة من أرقام منفردة (int أو bytes أو str)"""
+        ranges: List[Tuple[int, int]] = []
+        for msg_id in ids:
+            n = int(msg_id)
+            if ranges and n == ranges[-1][1] + 1:
+                ranges[-1] = (ranges[-1][0], n)
+            else:
+                ranges.append((n, n))
+        return cls(ranges)
+    
+    @classmethod
+    def from_esearch(cls, data) -> 'SequenceSet':
+        """قراءة ردّ ESEARCH (RFC 4731) مثل: (TAG "A5") MIN 1 MAX 90 COUNT 42 ALL 1:40,88:90"""
+        for line in data or []:
+            if isinstance(line, tuple):
+                line = line[0]
+            if not line:
+                continue
+            match = re.search(rb'\bALL\s+([\d:,]+)', line, re.IGNORECASE)
+            if match:
+                return cls.parse(match.group(1))
+        return cls()
+    
+    @property
+    def min(self) -> Optional[int]:
+        return self.ranges[0][0] if self.ranges else None
+    
+    @property
+    def max(self) -> Optional[int]:
+        return self.ranges[-1][1] if self.ranges else None
+    
+    def __len__(self) -> int:
+        return sum(end - start + 1 for start, end in self.ranges)
+    
+    def __iter__(self):
+        for start, end in self.ranges:
+            yield from range(start, end + 1)
+    
+    def __str__(self) -> str:
+        return ','.join(str(start) if start == end else f'{start}:{end}'
+                        for start, end in self.ranges)
+    
+    def __repr__(self) -> str:
+        return f"SequenceSet('{self}')"
+    
+    def tail(self, count: int) -> 'SequenceSet':
+        """آخر count رسالة (الأحدث) دون توسيع النطاقات"""
+        ranges = []
+        for start, end in reversed(self.ranges):
+            if count <= 0:
+                break
+            size = end - start + 1
+            if size > count:
+                start = end - count + 1
+                size = count
+            ranges.append((start, end))
+            count -= size
+        return SequenceSet(ranges)
+    
+    def chunks(self, size: int):
+        """تقسيم المجموعة إلى دفعات لا تتجاوز size رسالة، بشكل كسول"""
+        chunk: List[Tuple[int, int]] = []
+        room = size
+        for start, end in self.ranges:
+            while start <= end:
+                stop = min(end, start + room - 1)
+                chunk.append((start, stop))
+                room -= stop - start + 1
+                start = stop + 1
+                if room == 0:
+                    yield SequenceSet(chunk)
+                    chunk, room = [], size
+        if chunk:
+            yield SequenceSet(chunk)
+
+
+@dataclass
+class MessageFeatures:
+    """الخصائص المستخرجة من رسالة لتقييمها"""
+    sender_email: str
+    text: str
+    precedence: str
+    list_id: str
+    list_unsubscribe: str
+    list_unsubscribe_post: str
+    esp_hosts: Tuple[str, ...]
+
+
+class ScoringEngine:
+    """محرك تقييم الرسائل بقواعد موزونة تُجمَّع مرة واحدة إلى جداول وتعابير نمطية"""
+    
+    # List-Id و List-Unsubscribe-Post وبصمة المزود وحدها لا تكفي لبلوغ العتبة الافتراضية
+    # (0.3 + 0.3 + 0.3 < 1.0)، فتبقى نتيجة القواعد الافتراضية مطابقة للفحوص السابقة
+    DEFAULT_WEIGHTS = {
+        'precedence': 1.0,
+        'list_unsubscribe': 1.0,
+        'list_unsubscribe_post': 0.3,
+        'list_id': 0.3,
+    }
+    
+    # المرسل الموثوق يُستبعد مهما بلغت درجات الخصائص الأخرى
+    TRUSTED = float('-inf')
+    
+    BULK_PRECEDENCE = frozenset(('bulk', 'list', 'junk'))
+    ESP_HEADERS = frozenset(('received', 'x-mailer', 'feedback-id'))
+    # أسماء الخوادم في Received، والكلمات في X-Mailer و Feedback-ID
+    RECEIVED_HOST_RE = re.compile(r'(?:from|by)\s+([a-z0-9][a-z0-9.-]*)')
+    ESP_TOKEN_RE = re.compile(r'[a-z0-9][a-z0-9.-]*')
+    FEATURE_HEADERS = frozenset(('precedence', 'list-id', 'list-unsubscribe', 'list-unsubscribe-post'))
+    SENDER_CACHE_SIZE = 50000
+    
+    def __init__(self, rules: Dict):
+        self.rules = rules
+        self.threshold = float(rules.get('threshold', 1.0))
+        self._compile(rules)
+    
+    @staticmethod
+    def merge_rules(base: Dict, override: Dict) -> Dict:
+        """دمج قواعد المستخدم فوق القواعد الافتراضية"""
+        merged = dict(base)
+        for key, value in override.items():
+            if isinstance(value, list) and not isinstance(merged.get(key), dict):
+                merged[key] = list(merged.get(key, [])) + value
+            elif isinstance(value, list):
+                merged[key] = {**merged[key], **{item: 1.0 for item in value}}
+            elif isinstance(value, dict):
+                merged[key] = {**merged.get(key, {}), **value}
+            else:
+                merged[key] = value
+        return merged
+    
+    @staticmethod
+    def _alternation(patterns) -> Optional['re.Pattern']:
+        """تعبير نمطي واحد لكل الأنماط على شكل شجرة بادئات (الأطول أولاً عند كل موضع)"""
+        trie: Dict = {}
+        for pattern in {p.lower() for p in patterns if p}:
+            node = trie
+            for ch in pattern:
+                node = node.setdefault(ch, {})
+            node[''] = {}
+        if not trie:
+            return None
+        
+        def build(node: Dict) -> str:
+            branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+            if not branches:
+                return ''
+            body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+            if '' in node:
+                # نهاية نمط أقصر: التكرار الجشع يجرب الأطول أولاً
+                return body + '?' if len(branches) > 1 else '(?:' + body + ')?'
+            return body
+        
+        return re.compile(build(trie))
+    
+    def _compile(self, rules: Dict):
+        """تجميع القواعد إلى جداول بحث وتعابير نمطية"""
+        weights = {**self.DEFAULT_WEIGHTS, **rules.get('weights', {})}
+        self._w_precedence = float(weights['precedence'])
+        self._w_list_unsub = float(weights['list_unsubscribe'])
+        self._w_list_unsub_post = float(weights['list_unsubscribe_post'])
+        self._w_list_id = float(weights['list_id'])
+        
+        keywords = rules.get('keywords', {})
+        if isinstance(keywords, list):
+            keywords = {k: 1.0 for k in keywords}
+        self._keywords = {k.lower(): float(w) for k, w in keywords.items()}
+        self._keyword_re = self._alternation(self._keywords)
+        
+        esp = rules.get('esp_fingerprints', {})
+        self._esp = {k.lower().strip('.'): float(w) for k, w in esp.items()}
+        # عدد مقاطع كل لاحقة في الجدول (sendgrid.net = 2) حتى لا يُجرب إلا ما قد يطابق
+        self._esp_depths = sorted({k.count('.') + 1 for k in self._esp if '.' in k}, reverse=True)
+        self._esp_labels = {k: w for k, w in self._esp.items() if '.' not in k}
+        self._esp_cache: Dict[str, Optional[float]] = {}
+        
+        self._domains = {d.lower().lstrip('@.'): float(w)
+                         for d, w in rules.get('sender_domains', {}).items()}
+        self._trusted_re = self._alternation(rules.get('trusted_patterns', []))
+        self._sender_cache: Dict[str, float] = {}
+    
+    def extract(self, msg, subject: str, sender_email: str) -> MessageFeatures:
+        """استخراج الخصائص اللازمة من ترويسات الرسالة (بمرور واحد على الترويسات)"""
+        fields: Dict[str, str] = {}
+        received = []
+        tokens = []
+        for name, value in msg.items():
+            key = name.lower()
+            if key == 'received':
+                received.append(str(value))
+            elif key in self.ESP_HEADERS:
+                tokens.append(str(value))
+            elif key in self.FEATURE_HEADERS and key not in fields:
+                fields[key] = str(value)
+        
+        esp_hosts = set(self.RECEIVED_HOST_RE.findall(' '.join(received).lower())) if received else set()
+        if tokens:
+            esp_hosts.update(self.ESP_TOKEN_RE.findall(' '.join(tokens).lower()))
+        
+        return MessageFeatures(
+            sender_email=sender_email,
+            text=f"{subject} {sender_email}".lower(),
+            precedence=fields.get('precedence', '').strip().lower(),
+            list_id=fields.get('list-id', ''),
+            list_unsubscribe=fields.get('list-unsubscribe', ''),
+            list_unsubscribe_post=fields.get('list-unsubscribe-post', ''),
+            esp_hosts=tuple(esp_hosts),
+        )
+    
+    def score(self, features: MessageFeatures) -> float:
+        """حساب درجة الرسالة"""
+        total = self._sender_cache.get(features.sender_email)
+        if total is None:
+            total = self._score_sender(features.sender_email)
+        if total == self.TRUSTED:
+            return total
+        
+        if features.precedence in self.BULK_PRECEDENCE:
+            total += self._w_precedence
+        if features.list_unsubscribe:
+            total += self._w_list_unsub
+        if features.list_unsubscribe_post:
+            total += self._w_list_unsub_post
+        if features.list_id:
+            total += self._w_list_id
+        
+        if self._esp and features.esp_hosts:
+            # أقوى بصمة فقط: X-Mailer و Received لنفس المزود لا يُحسبان مرتين
+            best = None
+            cache = self._esp_cache
+            for host in features.esp_hosts:
+                weight = cache[host] if host in cache else self._score_esp_host(host)
+                if weight is not None and (best is None or weight > best):
+                    best = weight
+            if best is not None:
+                total += best
+        
+        if self._keyword_re:
+            hits = self._keyword_re.findall(features.text)
+            if hits:
+                total += sum(self._keywords[hit] for hit in set(hits))
+        
+        return total
+    
+    def _score_sender(self, sender_email: str) -> float:
+        """درجة المرسل (موثوق / نطاق معروف) مع حفظها لأن المرسلين يتكررون"""
+        total = 0.0
+        if self._trusted_re and self._trusted_re.search(sender_email):
+            total = self.TRUSTED
+        elif self._domains:
+            domain = sender_email.rpartition('@')[2]
+            while domain:
+                weight = self._domains.get(domain)
+                if weight is not None:
+                    total += weight
+                    break
+                domain = domain.partition('.')[2]
+        
+        if len(self._sender_cache) < self.SENDER_CACHE_SIZE:
+            self._sender_cache[sender_email] = total
+        return total
+    
+    def _score_esp_host(self, host: str) -> Optional[float]:
+        """بصمة المزود لاسم خادم: مطابقة لاحقة النطاق (sendgrid.net) أو أحد مقاطعه (mailgun)"""
+        weight = None
+        labels = host.split('.')
+        for depth in self._esp_depths:
+            if depth <= len(labels):
+                weight = self._esp.get('.'.join(labels[-depth:]))
+                if weight is not None:
+                    break
+        else:
+            esp_labels = self._esp_labels
+            for label in labels:
+                if label in esp_labels:
+                    weight = esp_labels[label]
+                    break
+        
+        if len(self._esp_cache) < self.SENDER_CACHE_SIZE:
+            self._esp_cache[host] = weight
+        return weight
+    
+    def score_batch(self, batch: List[MessageFeatures]) -> List[float]:
+        """تقييم دفعة من الرسائل"""
+        score = self.score
+        return [score(features) for features in batch]
+    
+    def classify_batch(self, batch: List[MessageFeatures]) -> List[bool]:
+        """تصنيف دفعة من الرسائل حسب العتبة"""
+        threshold = self.threshold
+        return [s >= threshold for s in self.score_batch(batch)]
+    
+    def is_promotional(self, msg, subject: str, sender_email: str) -> bool:
+        return self.score(self.extract(msg, subject, sender_email)) >= self.threshold
+    
+    def benchmark(self, count: int = 20000) -> Dict[str, float]:
+        """قياس متوسط زمن استخراج الخصائص وزمن التقييم لرسالة واحدة بالميكروثانية"""
+        # كل رسالة من مرسل مختلف حتى لا تخفي ذاكرة المرسلين كلفة التقييم الفعلية؛
+        # خوادم الترحيل تتكرر كما في الواقع (خادم المستلم ومجموعة خوادم المزود وخادم كل متجر)
+        templates = [
+            ("Received: from o{p}.sendgrid.net by mx.example.com; Mon, 1 Jan 2026 10:00:00 +0000\r\n"
+             "Received: from mta.shop{d}.com by o{p}.sendgrid.net; Mon, 1 Jan 2026 09:59:59 +0000\r\n"
+             "From: Shop <deals{i}@news.shop{d}.com>\r\nSubject: Big sale {i} - 50% off\r\n"
+             "List-Id: <news.shop{d}.com>\r\nList-Unsubscribe: <https://shop{d}.com/u/{i}>\r\n"
+             "List-Unsubscribe-Post: List-Unsubscribe=One-Click\r\n"),
+            ("Received: from mail.bank{d}.com by mx.example.com; Mon, 1 Jan 2026 10:00:00 +0000\r\n"
+             "From: Bank <security{i}@bank{d}.com>\r\nSubject: New sign-in to your account\r\n"),
+            ("Received: from mail.example{d}.com by mx.example.com; Mon, 1 Jan 2026 10:00:00 +0000\r\n"
+             "From: Friend <friend{i}@example{d}.com>\r\nSubject: Lunch tomorrow? ({i})\r\n"),
+            ("Received: from mail{p}.mcsv.net by mx.example.com; Mon, 1 Jan 2026 10:00:00 +0000\r\n"
+             "X-Mailer: MailChimp Mailer\r\nPrecedence: bulk\r\n"
+             "From: List <digest{i}@list{d}.org>\r\nSubject: Weekly digest #{i}\r\n"),
+        ]
+        common = "To: me@example.com\r\nDate: Mon, 1 Jan 2026 10:00:00 +0000\r\nMIME-Version: 1.0\r\n\r\n"
+        samples = []
+        for i in range(count):
+            msg = email.message_from_string(templates[i % len(templates)].format(i=i, d=i % 997, p=i % 64) + common)
+            sender_email = re.search(r'<([^>]+)>', msg['From']).group(1)
+            samples.append((msg, msg['Subject'], sender_email))
+        
+        start = time.perf_counter()
+        batch = [self.extract(msg, subject, sender_email) for msg, subject, sender_email in samples]
+        extract_time = time.perf_counter() - start
+        
+        self._sender_cache.clear()
+        self._esp_cache.clear()
+        start = time.perf_counter()
+        self.score_batch(batch)
+        score_time = time.perf_counter() - start
+        self._sender_cache.clear()
+        self._esp_cache.clear()
+        
+        return {
+            'extract': extract_time / count * 1e6,
+            'score': score_time / count * 1e6,
+        }
+
+
+class ReportWriter(ABC):
+    """كاتب تقرير متدفق: يكتب كل رسالة فور اكتشافها ورابط إلغاء الاشتراك مرة واحدة لكل مرسل"""
+    
+    # account و uidvalidity مع كل صف: أرقام UID لا معنى لها خارج صندوقها
+    FIELDS = ['uid', 'subject', 'sender', 'sender_email', 'date', 'folder', 'unsubscribe_link',
+              'account', 'uidvalidity']
+    
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.count = 0
+        self.links: Dict[str, str] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _open_text(filepath: str, mode: str):
+        if filepath.lower().endswith('.gz'):
+            return gzip.open(filepath, mode + 't', encoding='utf-8', newline='')
+        return open(filepath, mode, encoding='utf-8', newline='')
+    
+    @staticmethod
+    def _row(msg: EmailMessage, link: Optional[str]) -> list:
+        return [msg.uid, msg.subject, msg.sender, msg.sender_email, msg.date, msg.folder,
+                link, msg.account, msg.uidvalidity]
+    
+    def begin(self, meta: Dict):
+        """بيانات الفحص (التاريخ وغيره) قبل أول رسالة"""
+        with self._lock:
+            self._begin(meta)
+    
+    def write_message(self, msg: EmailMessage):
+        with self._lock:
+            link = None
+            if msg.unsubscribe_link and msg.sender_email not in self.links:
+                link = self.links[msg.sender_email] = msg.unsubscribe_link
+            self._write(msg, link)
+            self.count += 1
+    
+    def flush(self):
+        """حفظ ما كُتب على القرص (للمراقبة المستمرة)"""
+        with self._lock:
+            self._flush()
+    
+    def close(self, summary: Optional[Dict] = None):
+        """إنهاء التقرير مع ملخص اختياري (نتائج إلغاء الاشتراك وغيرها)"""
+        with self._lock:
+            self._close(summary or {})
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def _begin(self, meta: Dict):
+        pass
+    
+    @abstractmethod
+    def _write(self, msg: EmailMessage, link: Optional[str]):
+        ...
+    
+    @abstractmethod
+    def _flush(self):
+        ...
+    
+    @abstractmethod
+    def _close(self, summary: Dict):
+        ...
+
+
+class JsonLinesReportWriter(ReportWriter):
+    """سطر JSON لكل سجل: scan ثم message ثم summary"""
+    
+    def __init__(self, filepath: str):
+        super().__init__(filepath)
+        self._file = self._open_text(filepath, 'w')
+    
+    def _dump(self, record: Dict):
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+    
+    def _begin(self, meta: Dict):
+        self._dump({'type': 'scan', **meta})
+    
+    def _write(self, msg: EmailMessage, link: Optional[str]):
+        record = {'type': 'message', **dict(zip(self.FIELDS, self._row(msg, link)))}
+        if not link:
+            del record['unsubscribe_link']
+        self._dump(record)
+    
+    def _flush(self):
+        if not self._file.closed:
+            self._file.flush()
+    
+    def _close(self, summary: Dict):
+        if self._file.closed:
+            return
+        if summary:
+            self._dump({'type': 'summary', **summary})
+        self._file.close()
+
+
+class CsvReportWriter(ReportWriter):
+    """صف لكل رسالة؛ الرابط في أول صف للمرسل فقط"""
+    
+    # صفا البيانات الوصفية والملخص: المعرف في عمود uid و JSON في العمود التالي
+    SCAN_ROW = '#scan'
+    SUMMARY_ROW = '#summary'
+    
+    def __init__(self, filepath: str):
+        super().__init__(filepath)
+        self._file = self._open_text(filepath, 'w')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.FIELDS)
+    
+    def _begin(self, meta: Dict):
+        self._writer.writerow([self.SCAN_ROW, json.dumps(meta, ensure_ascii=False)])
+    
+    def _write(self, msg: EmailMessage, link: Optional[str]):
+        self._writer.writerow(['' if value is None else value for value in self._row(msg, link)])
+    
+    def _flush(self):
+        if not self._file.closed:
+            self._file.flush()
+    
+    def _close(self, summary: Dict):
+        if self._file.closed:
+            return
+        if summary:
+            self._writer.writerow([self.SUMMARY_ROW, json.dumps(summary, ensure_ascii=False)])
+        self._file.close()
+
+
+class SqliteReportWriter(ReportWriter):
+    """تقرير SQLite مفهرس حسب المرسل"""
+    
+    COMMIT_EVERY = 500
+    
+    def __init__(self, filepath: str):
+        super().__init__(filepath)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        self._db = sqlite3.connect(filepath, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE senders (sender_email TEXT PRIMARY KEY, unsubscribe_link TEXT,
+                                  unsubscribe_result TEXT);
+            CREATE TABLE messages (uid TEXT, subject TEXT, sender TEXT, sender_email TEXT,
+                                   date TEXT, folder TEXT, account TEXT, uidvalidity INTEGER);
+            CREATE INDEX idx_messages_sender ON messages (sender_email);
+        """)
+    
+    def _set_meta(self, meta: Dict):
+        self._db.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                             [(k, json.dumps(v, ensure_ascii=False)) for k, v in meta.items()])
+    
+    def _begin(self, meta: Dict):
+        self._set_meta(meta)
+    
+    def _write(self, msg: EmailMessage, link: Optional[str]):
+        self._db.execute('INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (msg.uid, msg.subject, msg.sender, msg.sender_email, msg.date, msg.folder,
+                          msg.account, msg.uidvalidity))
+        if link:
+            self._db.execute('INSERT OR IGNORE INTO senders (sender_email, unsubscribe_link) VALUES (?, ?)',
+                             (msg.sender_email, link))
+        if (self.count + 1) % self.COMMIT_EVERY == 0:
+            self._db.commit()
+    
+    def _flush(self):
+        if self._db is not None:
+            self._db.commit()
+    
+    def _close(self, summary: Dict):
+        if self._db is None:
+            return
+        summary = dict(summary)
+        results = summary.pop('unsubscribe_results', {}) or {}
+        self._db.executemany(
+            'INSERT INTO senders (sender_email, unsubscribe_result) VALUES (?, ?) '
+            'ON CONFLICT (sender_email) DO UPDATE SET unsubscribe_result = excluded.unsubscribe_result',
+            list(results.items())
+        )
+        self._set_meta(summary)
+        self._db.commit()
+        self._db.close()
+        self._db = None
+
+
+def open_report(filepath: str) -> ReportWriter:
+    """اختيار الكاتب حسب امتداد الملف (.jsonl / .csv مع .gz اختياري، أو .db / .sqlite)"""
+    name = filepath.lower()
+    if name.endswith(('.db', '.sqlite')):
+        return SqliteReportWriter(filepath)
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith('.csv'):
+        return CsvReportWriter(filepath)
+    if name.endswith(('.jsonl', '.ndjson')):
+        return JsonLinesReportWriter(filepath)
+    raise ValueError(f"صيغة تقرير غير مدعومة: {filepath}")
+
+
+def _read_jsonl(f, meta: Dict, rows: List[Dict]) -> int:
+    """قراءة سجلات JSON Lines؛ يعيد عدد الأسطر التالفة المتجاوزة (مثل سطر أخير مقطوع)"""
+    skipped = 0
+    try:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            if not isinstance(record, dict):
+                skipped += 1
+                continue
+            kind = record.pop('type', 'message')
+            if kind == 'message':
+                rows.append(record)
+            elif kind in ('scan', 'summary'):
+                meta.update(record)
+            else:
+                skipped += 1
+    except EOFError:
+        # ملف gzip لم يُغلق (انقطاع المراقبة) ينتهي دون تذييل
+        skipped += 1
+    return skipped
+
+
+def _read_csv(f, meta: Dict, rows: List[Dict]) -> int:
+    """قراءة صفوف CSV مع صفي #scan و #summary؛ يعيد عدد الصفوف التالفة المتجاوزة"""
+    skipped = 0
+    try:
+        for row in csv.DictReader(f):
+            if row.get('uid') in (CsvReportWriter.SCAN_ROW, CsvReportWriter.SUMMARY_ROW):
+                try:
+                    record = json.loads(row.get('subject') or '')
+                except ValueError:
+                    record = None
+                if isinstance(record, dict):
+                    meta.update(record)
+                else:
+                    skipped += 1
+            else:
+                rows.append(row)
+    except (EOFError, csv.Error):
+        # سطر أخير مقطوع أو ملف gzip لم يُغلق
+        skipped += 1
+    return skipped
+
+
+def _message_from_row(row: Dict, links: Dict[str, str]) -> Optional[EmailMessage]:
+    """تحويل صف تقرير إلى رسالة، أو None إن كان ناقصاً"""
+    uid = str(row.get('uid') or '')
+    sender_email = row.get('sender_email')
+    if not uid.isdigit() or not isinstance(sender_email, str) or not sender_email:
+        return None
+    try:
+        uidvalidity = int(row['uidvalidity']) if row.get('uidvalidity') not in (None, '') else None
+    except (TypeError, ValueError):
+        uidvalidity = None
+    return EmailMessage(
+        uid=uid,
+        subject=str(row.get('subject') or ''),
+        sender=str(row.get('sender') or ''),
+        sender_email=sender_email,
+        date=str(row.get('date') or ''),
+        unsubscribe_link=links.get(sender_email),
+        unsubscribe_email=None,
+        is_promotional=True,
+        folder=str(row.get('folder') or 'INBOX'),
+        account=str(row.get('account') or ''),
+        uidvalidity=uidvalidity
+    )
+
+
+def load_report(filepath: str) -> Tuple[Dict, List[EmailMessage]]:
+    """قراءة تقرير متدفق؛ يعيد (البيانات الوصفية، الرسائل) مع نشر رابط كل مرسل على رسائله"""
+    meta: Dict = {}
+    rows: List[Dict] = []
+    skipped = 0
+    name = filepath.lower()
+    
+    if name.endswith(('.db', '.sqlite')):
+        db = sqlite3.connect(filepath)
+        try:
+            meta = {k: json.loads(v) for k, v in db.execute('SELECT key, value FROM meta')}
+            senders = db.execute('SELECT sender_email, unsubscribe_link, unsubscribe_result FROM senders').fetchall()
+            meta['unsubscribe_results'] = {s: r for s, _, r in senders if r}
+            links = {s: link for s, link, _ in senders if link}
+            rows = [
+                dict(zip(ReportWriter.FIELDS, row[:6] + (links.get(row[3]),) + row[6:]))
+                for row in db.execute('SELECT uid, subject, sender, sender_email, date, folder, '
+                                      'account, uidvalidity FROM messages ORDER BY rowid')
+            ]
+        finally:
+            db.close()
+    elif name.endswith(('.csv', '.csv.gz')):
+        with ReportWriter._open_text(filepath, 'r') as f:
+            skipped += _read_csv(f, meta, rows)
+    elif name.endswith(('.jsonl', '.jsonl.gz', '.ndjson', '.ndjson.gz')):
+        with ReportWriter._open_text(filepath, 'r') as f:
+            skipped += _read_jsonl(f, meta, rows)
+    elif name.endswith('.json'):
+        raise ValueError("تقرير .json ملخص لا يحتوي الرسائل؛ استخدم .jsonl أو .csv أو .db للاستئناف")
+    else:
+        raise ValueError(f"صيغة تقرير غير مدعومة: {filepath}")
+    
+    links: Dict[str, str] = {}
+    for row in rows:
+        link = row.get('unsubscribe_link')
+        if link and isinstance(row.get('sender_email'), str):
+            links.setdefault(row['sender_email'], link)
+    
+    messages = []
+    for row in rows:
+        msg = _message_from_row(row, links)
+        if msg is None:
+            skipped += 1
+        else:
+            messages.append(msg)
+    
+    meta['skipped'] = skipped
+    return meta, messages
 
 
 class EmailCleanerCore:
@@ -84,11 +795,31 @@ class EmailCleanerCore:
         'billing@', 'invoice@', 'receipt@', 'order@', 'shipping@',
     ]
     
+    # بصمات مزودي البريد الجماعي في ترويسات Received و X-Mailer و Feedback-ID
+    # (لاحقة نطاق مثل sendgrid.net، أو كلمة مثل mailchimp تطابق مقطعاً من اسم الخادم أو X-Mailer)
+    # (تُرسل عبرها الإيصالات أيضاً، لذا أوزانها لا تكفي وحدها للتصنيف)
+    ESP_FINGERPRINTS = {
+        'sendgrid.net': 0.3, 'mcsv.net': 0.3, 'rsgsv.net': 0.3, 'mailchimp': 0.3,
+        'mandrillapp.com': 0.2, 'mailgun': 0.2, 'sparkpostmail.com': 0.3,
+        'amazonses.com': 0.2, 'exacttarget.com': 0.3, 'createsend.com': 0.3,
+        'klaviyomail.com': 0.3, 'hubspotemail.net': 0.3, 'constantcontact': 0.3, 'ccsend.com': 0.3,
+        'sailthru': 0.3,
+        'braze': 0.3, 'mktomail': 0.3, 'pardot': 0.3,
+    }
+    
+    # حجم الدفعات عند جلب الرسائل ووضع علامات الحذف
+    FETCH_CHUNK_SIZE = 20
+    STORE_CHUNK_SIZE = 500
+    
     def __init__(self):
         self.connection: Optional[imaplib.IMAP4_SSL] = None
         self.messages: List[EmailMessage] = []
         self.stats = defaultdict(int)
         self.unsubscribe_results = {}
+        self.unsubscribe_queue: Dict[str, str] = {}
+        self.uidvalidity: Optional[int] = None
+        self.account = ''
+        self.scoring = ScoringEngine(self.default_rules())
         
     def get_server_info(self, email_address: str) -> Tuple[str, int]:
         """الحصول على معلومات الخادم"""
@@ -101,6 +832,8 @@ class EmailCleanerCore:
             server, port = self.get_server_info(email_address)
             self.connection = imaplib.IMAP4_SSL(server, port)
             self.connection.login(email_address, password)
+            self.account = email_address.lower()
+            self._refresh_capabilities()
             return True, "تم الاتصال بنجاح ✅"
         except imaplib.IMAP4.error as e:
             return False, f"خطأ في تسجيل الدخول: {str(e)}"
@@ -116,6 +849,39 @@ class EmailCleanerCore:
                 pass
             self.connection = None
     
+    def _refresh_capabilities(self, connection: Optional[imaplib.IMAP4] = None):
+        """تحديث قدرات الخادم بعد تسجيل الدخول (بعضها لا يُعلن قبله)"""
+        connection = connection or self.connection
+        try:
+            typ, data = connection.capability()
+            if typ == 'OK' and data and data[-1]:
+                connection.capabilities = tuple(data[-1].decode().upper().split())
+        except Exception:
+            pass
+    
+    def _search(self, criteria: str) -> SequenceSet:
+        """البحث بأرقام UID مع ESEARCH (RFC 4731) إن دعمه الخادم للحصول على نطاقات مضغوطة"""
+        if 'ESEARCH' in self.connection.capabilities:
+            try:
+                typ, _ = self.connection.xatom('UID', 'SEARCH', 'RETURN (MIN MAX COUNT ALL)', criteria)
+                if typ == 'OK':
+                    _, data = self.connection.response('ESEARCH')
+                    return SequenceSet.from_esearch(data)
+            except imaplib.IMAP4.error:
+                pass
+        
+        # الرجوع إلى SEARCH العادي مع ضغط الأرقام مباشرة دون بناء قائمة
+        _, message_ids = self.connection.uid('SEARCH', None, criteria)
+        return SequenceSet.from_ids(
+            m.group() for m in re.finditer(rb'\d+', message_ids[0] or b'')
+        )
+    
+    def _select_inbox(self):
+        """تحديد صندوق الوارد وحفظ UIDVALIDITY الخاص به"""
+        self.connection.select('INBOX')
+        _, data = self.connection.response('UIDVALIDITY')
+        return int(data[-1]) if data and data[-1] else None
+    
     def _decode_header_value(self, value) -> str:
         """فك تشفير العنوان"""
         if not value:
@@ -154,26 +920,35 @@ class EmailCleanerCore:
                 return match.group(1)
         return None
     
+    def default_rules(self) -> Dict:
+        """القواعد الافتراضية للتقييم"""
+        return {
+            'threshold': 1.0,
+            'weights': dict(ScoringEngine.DEFAULT_WEIGHTS),
+            'keywords': {k: 1.0 for k in self.PROMOTIONAL_KEYWORDS},
+            'esp_fingerprints': dict(self.ESP_FINGERPRINTS),
+            'sender_domains': {},
+            'trusted_patterns': list(self.TRUSTED_PATTERNS),
+        }
+    
+    def load_rules(self, filepath: str) -> Tuple[bool, str]:
+        """تحميل ملف قواعد المستخدم (JSON) فوق القواعد الافتراضية"""
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                user_rules = json.load(f)
+            rules = ScoringEngine.merge_rules(self.default_rules(), user_rules)
+            self.scoring = ScoringEngine(rules)
+            return True, f"تم تحميل القواعد ✅ (العتبة: {self.scoring.threshold})"
+        except (OSError, ValueError, TypeError, AttributeError, re.error) as e:
+            return False, f"خطأ في ملف القواعد: {str(e)}"
+    
     def _is_promotional(self, msg, subject: str, sender_email: str) -> bool:
         """تحديد إذا كانت الرسالة دعائية"""
-        for trusted in self.TRUSTED_PATTERNS:
-            if trusted in sender_email:
-                return False
-        
-        if msg.get('Precedence', '').lower() in ['bulk', 'list', 'junk']:
-            return True
-        if msg.get('List-Unsubscribe'):
-            return True
-        
-        text = f"{subject} {sender_email}".lower()
-        for keyword in self.PROMOTIONAL_KEYWORDS:
-            if keyword.lower() in text:
-                return True
-        return False
+        return self.scoring.is_promotional(msg, subject, sender_email)
     
     def scan_inbox(self, days_back: int = 30, limit: int = 500, 
-                   callback=None) -> List[EmailMessage]:
-        """فحص صندوق الوارد"""
+                   callback=None, report: Optional[ReportWriter] = None) -> List[EmailMessage]:
+        """فحص صندوق الوارد (مع كتابة النتائج في report أولاً بأول إن وُجد)"""
         if not self.connection:
             return []
         
@@ -181,52 +956,66 @@ class EmailCleanerCore:
         self.stats.clear()
         
         try:
-            self.connection.select('INBOX')
+            self.uidvalidity = self._select_inbox()
+            if report:
+                report.begin(self._report_meta())
             since_date = (datetime.now() - timedelta(days=days_back)).strftime('%d-%b-%Y')
-            _, message_ids = self.connection.search(None, f'(SINCE "{since_date}")')
-            
-            ids = message_ids[0].split()
-            total = min(len(ids), limit)
+            ids = self._search(f'(SINCE "{since_date}")').tail(limit)
+            total = len(ids)
             
             if callback:
                 callback(f"جاري فحص {total} رسالة...", 0)
             
-            for i, msg_id in enumerate(ids[-limit:], 1):
-                try:
-                    _, msg_data = self.connection.fetch(msg_id, '(RFC822)')
-                    if msg_data[0] is None:
+            i = 0
+            skipped = 0
+            for chunk in ids.chunks(self.FETCH_CHUNK_SIZE):
+                msg_data, failed = self._fetch_chunk(chunk)
+                skipped += failed
+                i += len(chunk)
+                
+                fetched, unreadable = self._parse_fetch(msg_data)
+                skipped += unreadable
+                parsed = []
+                for msg_id, body in fetched:
+                    try:
+                        msg = email.message_from_bytes(body)
+                        subject = self._decode_header_value(msg.get('Subject', ''))
+                        sender_name, sender_email = self._extract_email_address(msg.get('From', ''))
+                        features = self.scoring.extract(msg, subject, sender_email)
+                        parsed.append((msg_id, msg, subject, sender_name, sender_email, features))
+                    except Exception:
+                        skipped += 1
+                
+                verdicts = self.scoring.classify_batch([p[-1] for p in parsed])
+                for (msg_id, msg, subject, sender_name, sender_email, _), promotional in zip(parsed, verdicts):
+                    if not promotional:
                         continue
                     
-                    msg = email.message_from_bytes(msg_data[0][1])
-                    subject = self._decode_header_value(msg.get('Subject', ''))
-                    sender_name, sender_email = self._extract_email_address(msg.get('From', ''))
-                    
-                    if self._is_promotional(msg, subject, sender_email):
-                        unsub_link = self._extract_unsubscribe_link(msg)
-                        
-                        email_msg = EmailMessage(
-                            uid=msg_id.decode(),
-                            subject=subject[:80] if subject else "(بدون عنوان)",
-                            sender=sender_name,
-                            sender_email=sender_email,
-                            date=msg.get('Date', ''),
-                            unsubscribe_link=unsub_link,
-                            unsubscribe_email=None,
-                            is_promotional=True,
-                            folder='INBOX'
-                        )
-                        self.messages.append(email_msg)
-                        self.stats[sender_email] += 1
-                    
-                    if callback and i % 20 == 0:
-                        progress = int((i / total) * 100)
-                        callback(f"تم فحص {i}/{total} رسالة ({len(self.messages)} دعائية)", progress)
-                        
-                except Exception:
-                    continue
+                    email_msg = EmailMessage(
+                        uid=msg_id.decode(),
+                        subject=subject[:80] if subject else "(بدون عنوان)",
+                        sender=sender_name,
+                        sender_email=sender_email,
+                        date=msg.get('Date', ''),
+                        unsubscribe_link=self._extract_unsubscribe_link(msg),
+                        unsubscribe_email=None,
+                        is_promotional=True,
+                        folder='INBOX',
+                        account=self.account,
+                        uidvalidity=self.uidvalidity
+                    )
+                    self.messages.append(email_msg)
+                    self.stats[sender_email] += 1
+                    if report:
+                        report.write_message(email_msg)
+                
+                if callback and total:
+                    progress = int((min(i, total) / total) * 100)
+                    callback(f"تم فحص {i}/{total} رسالة ({len(self.messages)} دعائية)", progress)
             
             if callback:
-                callback(f"اكتمل الفحص: {len(self.messages)} رسالة دعائية", 100)
+                note = f" (تعذر جلب أو قراءة {skipped} رسالة)" if skipped else ""
+                callback(f"اكتمل الفحص: {len(self.messages)} رسالة دعائية{note}", 100)
             
             return self.messages
             
@@ -235,6 +1024,59 @@ class EmailCleanerCore:
                 callback(f"خطأ: {str(e)}", 0)
             return []
     
+    @staticmethod
+    def _parse_fetch(msg_data: list) -> Tuple[List[Tuple[bytes, bytes]], int]:
+        """أزواج (UID، المحتوى) من رد FETCH مع عدد ما تعذر ربطه بـ UID
+        
+        RFC 3501 لا يحدد ترتيب العناصر، فقد يأتي UID بعد المحتوى في العنصر التالي.
+        """
+        fetched, unreadable = [], 0
+        pending = None
+        for part in msg_data:
+            if isinstance(part, tuple):
+                if pending is not None:
+                    unreadable += 1
+                match = re.search(rb'UID (\d+)', part[0])
+                if match:
+                    fetched.append((match.group(1), part[1]))
+                    pending = None
+                else:
+                    pending = part[1]
+            elif pending is not None:
+                match = re.search(rb'UID (\d+)', part or b'')
+                if match:
+                    fetched.append((match.group(1), pending))
+                else:
+                    unreadable += 1
+                pending = None
+        if pending is not None:
+            unreadable += 1
+        return fetched, unreadable
+    
+    def _fetch_chunk(self, chunk: SequenceSet) -> Tuple[list, int]:
+        """جلب دفعة رسائل؛ عند فشلها تُجلب رسائلها واحدة واحدة حتى لا تضيع الدفعة كلها"""
+        try:
+            typ, msg_data = self.connection.uid('FETCH', str(chunk), '(RFC822)')
+            if typ == 'OK':
+                return msg_data, 0
+        except imaplib.IMAP4.abort:
+            raise
+        except Exception:
+            pass
+        
+        msg_data, failed = [], 0
+        for uid in chunk:
+            try:
+                typ, data = self.connection.uid('FETCH', str(uid), '(RFC822)')
+                if typ != 'OK':
+                    raise imaplib.IMAP4.error(typ)
+                msg_data.extend(data)
+            except imaplib.IMAP4.abort:
+                raise
+            except Exception:
+                failed += 1
+        return msg_data, failed
+    
     def delete_messages(self, messages: List[EmailMessage] = None) -> Tuple[int, str]:
         """حذف الرسائل"""
         if not self.connection:
@@ -245,13 +1087,20 @@ class EmailCleanerCore:
             return 0, "لا توجد رسائل للحذف"
         
         try:
-            self.connection.select('INBOX')
+            uidvalidity = self._select_inbox()
+            # أرقام UID تخص حساباً وUIDVALIDITY بعينهما؛ الحذف بأرقام من صندوق آخر يحذف رسائل خاطئة
+            stale = [msg for msg in to_delete
+                     if msg.account != self.account or msg.uidvalidity is None or msg.uidvalidity != uidvalidity]
+            if stale:
+                return 0, (f"{len(stale)} رسالة لا تخص هذا الحساب أو تغيرت أرقامها على الخادم (UIDVALIDITY)، "
+                           "أعد الفحص قبل الحذف")
             deleted = 0
             
-            for msg in to_delete:
+            ids = SequenceSet.from_ids(msg.uid for msg in to_delete)
+            for chunk in ids.chunks(self.STORE_CHUNK_SIZE):
                 try:
-                    self.connection.store(msg.uid.encode(), '+FLAGS', '\\Deleted')
-                    deleted += 1
+                    self.connection.uid('STORE', str(chunk), '+FLAGS', '\\Deleted')
+                    deleted += len(chunk)
                 except:
                     pass
             
@@ -271,8 +1120,14 @@ class EmailCleanerCore:
         for msg in self.messages:
             if msg.unsubscribe_link and msg.sender_email not in links:
                 links[msg.sender_email] = msg.unsubscribe_link
+        for sender, link in dict(self.unsubscribe_queue).items():
+            links.setdefault(sender, link)
         return links
     
+    def queue_unsubscribe(self, sender_email: str, link: str):
+        """إضافة رابط إلغاء اشتراك للطابور (يُنفذ مع إلغاء الاشتراك التلقائي)"""
+        self.unsubscribe_queue.setdefault(sender_email, link)
+    
     def auto_unsubscribe(self, callback=None) -> Dict[str, str]:
         """إلغاء الاشتراك تلقائياً من جميع القوائم البريدية"""
         if not REQUESTS_AVAILABLE:
@@ -321,6 +1176,8 @@ class EmailCleanerCore:
                 callback(f"تم معالجة {i}/{total}", progress)
         
         self.unsubscribe_results = results
+        for sender in results:
+            self.unsubscribe_queue.pop(sender, None)
         
         if callback:
             success = sum(1 for v in results.values() if '✅' in v)
@@ -328,34 +1185,357 @@ class EmailCleanerCore:
         
         return results
     
-    def export_results(self, filepath: str) -> int:
-        """تصدير النتائج لملف"""
-        data = {
-            "scan_date": datetime.now().isoformat(),
+    def _report_meta(self) -> Dict:
+        return {"scan_date": datetime.now().isoformat(), "account": self.account}
+    
+    def _report_summary(self) -> Dict:
+        return {
             "total_promotional": len(self.messages),
             "unique_senders": len(self.stats),
-            "senders_summary": dict(self.get_senders_summary()),
-            "unsubscribe_results": self.unsubscribe_results,
-            "links": [
-                {
+            "unsubscribe_results": dict(self.unsubscribe_results),
+        }
+    
+    def export_results(self, filepath: str) -> int:
+        """تصدير النتائج لملف (JSON أو JSONL أو CSV أو SQLite، مع gzip اختياري)"""
+        if not filepath.lower().endswith('.json'):
+            with open_report(filepath) as report:
+                report.begin(self._report_meta())
+                for msg in self.messages:
+                    report.write_message(msg)
+                report.close(self._report_summary())
+            return len(report.links)
+        
+        links = {}
+        for msg in self.messages:
+            if msg.unsubscribe_link and msg.sender_email not in links:
+                links[msg.sender_email] = {
                     "sender": msg.sender,
                     "email": msg.sender_email,
                     "link": msg.unsubscribe_link
                 }
-                for msg in self.messages if msg.unsubscribe_link
-            ]
+        
+        data = {
+            **self._report_meta(),
+            **self._report_summary(),
+            "senders_summary": dict(self.get_senders_summary()),
+            "links": list(links.values())
         }
         
         with open(filepath, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
         
         return len(data['links'])
+    
+    def load_results(self, filepath: str) -> Tuple[bool, str]:
+        """استئناف جلسة سابقة من تقرير متدفق دون إعادة الفحص"""
+        try:
+            meta, messages = load_report(filepath)
+        except (OSError, EOFError, ValueError, csv.Error, sqlite3.Error) as e:
+            return False, f"خطأ في قراءة التقرير: {str(e)}"
+        
+        self.messages = messages
+        self.stats.clear()
+        for msg in messages:
+            self.stats[msg.sender_email] += 1
+        self.unsubscribe_results = meta.get('unsubscribe_results') or {}
+        note = f" (تجاوز {meta['skipped']} سجل تالف)" if meta.get('skipped') else ""
+        return True, f"تم تحميل {len(messages)} رسالة من التقرير ✅{note}"
+
+
+class InboxWatcher:
+    """مراقبة صندوق الوارد عبر IMAP IDLE (RFC 2177) وتصنيف الرسائل الجديدة فور وصولها"""
+    
+    ACTIONS = ('move', 'delete', 'unsubscribe')
+    
+    # يجب إعادة إرسال IDLE قبل 30 دقيقة حتى لا يقطع الخادم الاتصال
+    IDLE_TIMEOUT = 29 * 60
+    POLL_INTERVAL = 60
+    RECONNECT_DELAY = 30
+    # مهلة كل قراءة من المقبس: اتصال نصف مفتوح (NAT) يُكتشف ويُعاد بدل أن يعلق الخيط للأبد
+    SOCKET_TIMEOUT = 120
+    
+    def __init__(self, core: EmailCleanerCore, email_address: str, password: str,
+                 actions: Optional[List[str]] = None, move_to: str = 'Promotions',
+                 callback=None, report: Optional[ReportWriter] = None):
+        self.core = core
+        self.email_address = email_address
+        self.password = password
+        self.actions = [a for a in (actions or []) if a in self.ACTIONS]
+        self.move_to = move_to
+        self.callback = callback
+        self.report = report
+        self.connection: Optional[imaplib.IMAP4_SSL] = None
+        self.uid_next = 0
+        self.uidvalidity: Optional[int] = None
+        self.handled = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        """بدء المراقبة في خيط منفصل"""
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        """إيقاف المراقبة (تنتهي دورة IDLE الحالية خلال ثانية)"""
+        self._stop.set()
+    
+    def join(self, timeout: Optional[float] = None):
+        """انتظار انتهاء خيط المراقبة (بعد stop) قبل إغلاق التقرير المشترك"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def _log(self, message: str):
+        if self.callback:
+            self.callback(f"👁️ {self.email_address}: {message}")
+    
+    def _connect(self):
+        """فتح اتصال مستقل للمراقبة وتسجيل الدخول"""
+        server, port = self.core.get_server_info(self.email_address)
+        self.connection = imaplib.IMAP4_SSL(server, port, timeout=self.SOCKET_TIMEOUT)
+        self.connection.login(self.email_address, self.password)
+    
+    def _prepare(self):
+        """تحديد صندوق الوارد ونقطة البداية (UIDNEXT)"""
+        self.core._refresh_capabilities(self.connection)
+        self.connection.select('INBOX')
+        _, data = self.connection.response('UIDVALIDITY')
+        uidvalidity = int(data[-1]) if data and data[-1] else None
+        _, data = self.connection.response('UIDNEXT')
+        uid_next = int(data[-1]) if data and data[-1] else None
+        if uidvalidity != self.uidvalidity:
+            # أرقام UID القديمة لم تعد صالحة بعد تغير UIDVALIDITY
+            self.uidvalidity = uidvalidity
+            self.uid_next = 0
+        if 'move' in self.actions:
+            self.connection.create(f'"{self.move_to}"')
+        
+        if not self.uid_next:
+            if uid_next is None:
+                # خادم لم يُرسل UIDNEXT مع SELECT: أعلى UID حالي (UID * يعيد آخر رسالة)
+                _, data = self.connection.uid('SEARCH', None, 'UID *')
+                uids = (data[0] or b'').split()
+                uid_next = int(uids[-1]) + 1 if uids else 1
+            self.uid_next = uid_next
+    
+    def _disconnect(self):
+        if self.connection:
+            try:
+                self.connection.logout()
+            except:
+                pass
+            self.connection = None
+    
+    def run(self):
+        """حلقة المراقبة مع إعادة الاتصال عند الانقطاع"""
+        while not self._stop.is_set():
+            try:
+                self._connect()
+            except imaplib.IMAP4.abort as e:
+                self._log(f"تعذر الاتصال: {str(e)[:60]}")
+                self._disconnect()
+                self._stop.wait(self.RECONNECT_DELAY)
+                continue
+            except imaplib.IMAP4.error as e:
+                # إعادة المحاولة بكلمة مرور خاطئة قد تقفل الحساب
+                self._log(f"❌ رفض الخادم تسجيل الدخول، توقفت المراقبة: {str(e)[:60]}")
+                self._disconnect()
+                break
+            except Exception as e:
+                self._log(f"تعذر الاتصال: {str(e)[:60]}")
+                self._disconnect()
+                self._stop.wait(self.RECONNECT_DELAY)
+                continue
+            
+            try:
+                self._prepare()
+                idle = 'IDLE' in self.connection.capabilities
+                self._log("بدأت المراقبة ✅" if idle else "الخادم لا يدعم IDLE، سيتم الفحص الدوري")
+                
+                while not self._stop.is_set():
+                    self._process_new()
+                    if self._take_untagged():
+                        continue
+                    if idle:
+                        self._idle()
+                    elif not self._stop.wait(self.POLL_INTERVAL):
+                        self.connection.noop()
+                        
+            except Exception as e:
+                self._log(f"انقطع الاتصال: {str(e)[:60]}")
+                self._stop.wait(self.RECONNECT_DELAY)
+            finally:
+                self._disconnect()
+        
+        self._log(f"توقفت المراقبة ({self.handled} رسالة دعائية)")
+    
+    def _idle(self):
+        """انتظار إشعار EXISTS من الخادم أو انتهاء المهلة"""
+        conn = self.connection
+        tag = conn._new_tag()
+        conn.send(tag + b' IDLE\r\n')
+        line = conn.readline()
+        if not line.startswith(b'+'):
+            raise imaplib.IMAP4.error(f"IDLE مرفوض: {line.strip()!r}")
+        
+        deadline = time.monotonic() + self.IDLE_TIMEOUT
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            if not self._has_buffered_data():
+                readable, _, _ = select.select([conn.sock], [], [], 1.0)
+                if not readable:
+                    continue
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("أغلق الخادم الاتصال")
+            if re.match(rb'\* \d+ EXISTS', line):
+                break
+        
+        conn.send(b'DONE\r\n')
+        while True:
+            line = conn.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("أغلق الخادم الاتصال")
+            if line.startswith(tag):
+                break
+    
+    def _has_buffered_data(self) -> bool:
+        """هل قرأ imaplib (أو طبقة SSL) بيانات مسبقاً لا يراها select على المقبس؟"""
+        conn = self.connection
+        timeout = conn.sock.gettimeout()
+        conn.sock.settimeout(0)
+        try:
+            return bool(conn.file.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            conn.sock.settimeout(timeout)
+    
+    def _take_untagged(self) -> bool:
+        """تفريغ كل الردود غير الموسومة المخزنة (EXISTS و EXPUNGE و OK و COPYUID وغيرها)
+        حتى لا تتراكم على اتصال يبقى مفتوحاً أسابيع؛ يعيد True عند وصول رسائل"""
+        responses = self.connection.untagged_responses
+        arrived = 'EXISTS' in responses
+        responses.clear()
+        return arrived
+    
+    def _expunge(self, uids: str) -> bool:
+        """حذف نهائي لهذه الرسائل فقط (UID EXPUNGE)؛ دون UIDPLUS تبقى معلّمة بـ \\Deleted"""
+        if 'UIDPLUS' not in self.connection.capabilities:
+            return False
+        self.connection.uid('EXPUNGE', uids)
+        return True
+    
+    def _process_new(self):
+        """جلب ترويسات الرسائل الجديدة فقط وتصنيفها"""
+        conn = self.connection
+        _, data = conn.uid('SEARCH', None, f'UID {self.uid_next}:*')
+        # UID n:* يعيد دائماً آخر رسالة حتى لو كان رقمها أقل من n
+        new = SequenceSet.from_ids(
+            uid for uid in (int(x) for x in (data[0] or b'').split()) if uid >= self.uid_next
+        )
+        if not new:
+            return
+        self.uid_next = new.max + 1
+        
+        promotional: List[Tuple[int, EmailMessage]] = []
+        skipped = 0
+        for chunk in new.chunks(self.core.FETCH_CHUNK_SIZE):
+            _, msg_data = conn.uid('FETCH', str(chunk), '(BODY.PEEK[HEADER])')
+            fetched, unreadable = self.core._parse_fetch(msg_data)
+            skipped += unreadable
+            for uid, header in fetched:
+                try:
+                    uid = int(uid)
+                    msg = email.message_from_bytes(header)
+                    subject = self.core._decode_header_value(msg.get('Subject', ''))
+                    sender_name, sender_email = self.core._extract_email_address(msg.get('From', ''))
+                    
+                    if self.core._is_promotional(msg, subject, sender_email):
+                        promotional.append((uid, EmailMessage(
+                            uid=str(uid),
+                            subject=subject[:80] if subject else "(بدون عنوان)",
+                            sender=sender_name,
+                            sender_email=sender_email,
+                            date=msg.get('Date', ''),
+                            unsubscribe_link=self.core._extract_unsubscribe_link(msg),
+                            unsubscribe_email=None,
+                            is_promotional=True,
+                            folder='INBOX',
+                            account=self.email_address.lower(),
+                            uidvalidity=self.uidvalidity
+                        )))
+                except Exception:
+                    skipped += 1
+        
+        if skipped:
+            self._log(f"⚠️ تعذر قراءة {skipped} رسالة جديدة")
+        if promotional:
+            self._apply_actions(promotional)
+    
+    def _apply_actions(self, promotional: List[Tuple[int, EmailMessage]]):
+        """تنفيذ الإجراءات المحددة على الرسائل الدعائية الجديدة"""
+        conn = self.connection
+        uids = str(SequenceSet.from_ids(uid for uid, _ in promotional))
+        self.handled += len(promotional)
+        
+        for _, msg in promotional:
+            self._log(f"📨 دعائية: {msg.sender_email} - {msg.subject}")
+            if self.report:
+                self.report.write_message(msg)
+            if 'unsubscribe' in self.actions and msg.unsubscribe_link:
+                self.core.queue_unsubscribe(msg.sender_email, msg.unsubscribe_link)
+        
+        if 'move' in self.actions:
+            folder = f'"{self.move_to}"'
+            if 'MOVE' in conn.capabilities:
+                typ, data = conn.uid('MOVE', uids, folder)
+            else:
+                # الحذف بعد COPY فقط إن نجح النسخ، وإلا تضيع الرسائل (مجلد مفقود أو حصة ممتلئة)
+                typ, data = conn.uid('COPY', uids, folder)
+                if typ == 'OK':
+                    typ, data = conn.uid('STORE', uids, '+FLAGS', '\\Deleted')
+                    if typ == 'OK':
+                        self._expunge(uids)
+            if typ == 'OK':
+                self._log(f"📁 نقل {len(promotional)} رسالة إلى {self.move_to}")
+            else:
+                self._log(f"❌ تعذر النقل إلى {self.move_to}: {data[0]!r}")
+        elif 'delete' in self.actions:
+            typ, data = conn.uid('STORE', uids, '+FLAGS', '\\Deleted')
+            if typ != 'OK':
+                self._log(f"❌ تعذر الحذف: {data[0]!r}")
+            elif self._expunge(uids):
+                self._log(f"🗑️ حذف {len(promotional)} رسالة")
+            else:
+                self._log(f"🗑️ تعليم {len(promotional)} رسالة بـ \\Deleted (الخادم لا يدعم UIDPLUS)")
 
 
 class EmailCleanerGUI:
     """الواجهة الرسومية للتطبيق"""
     
-    def __init__(self):
+    # صيغ يمكن استئناف الجلسة منها؛ JSON ملخص للتصدير فقط
+    REPORT_FILETYPES = [
+        ("JSON Lines", "*.jsonl *.jsonl.gz"),
+        ("CSV", "*.csv *.csv.gz"),
+        ("SQLite", "*.db *.sqlite"),
+    ]
+    SUMMARY_FILETYPE = ("JSON (ملخص)", "*.json")
+    
+    WATCH_ACTIONS = [
+        ("تنبيه فقط", []),
+        ("نقل", ['move']),
+        ("حذف", ['delete']),
+        ("إلغاء الاشتراك", ['unsubscribe']),
+    ]
+    
+    def __init__(self, rules_file: Optional[str] = None):
         self.root = tk.Tk()
         self.root.title(f"{__title__} v{__version__}")
         self.root.geometry("850x700")
@@ -375,11 +1555,15 @@ class EmailCleanerGUI:
         self.root.configure(bg=self.colors['bg'])
         
         self.core = EmailCleanerCore()
+        self.watcher: Optional[InboxWatcher] = None
         self.is_connected = False
         
         self._setup_styles()
         self._create_widgets()
         
+        if rules_file:
+            self._log(self.core.load_rules(rules_file)[1])
+        
         self.root.protocol("WM_DELETE_WINDOW", self._on_closing)
     
     def _setup_styles(self):
@@ -464,6 +1648,23 @@ class EmailCleanerGUI:
         ttk.Spinbox(settings_frame, from_=50, to=2000, textvariable=self.limit_var,
                    width=6, increment=50, font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=5)
         
+        # اختيار ملف التقرير قبل الفحص حتى تُكتب الرسائل فيه أولاً بأول
+        self.stream_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="💾 حفظ أثناء الفحص",
+                        variable=self.stream_var).pack(side=tk.LEFT, padx=10)
+        
+        self.rules_btn = tk.Button(settings_frame, text="📜 القواعد", command=self._load_rules,
+                                   bg=self.colors['accent'], fg='white',
+                                   font=('Segoe UI', 9, 'bold'), relief=tk.FLAT,
+                                   padx=10, cursor='hand2')
+        self.rules_btn.pack(side=tk.RIGHT, padx=5)
+        
+        self.watch_action_var = tk.StringVar(value=self.WATCH_ACTIONS[0][0])
+        ttk.Combobox(settings_frame, textvariable=self.watch_action_var, state='readonly',
+                     values=[label for label, _ in self.WATCH_ACTIONS],
+                     width=14, font=('Segoe UI', 10)).pack(side=tk.RIGHT, padx=5)
+        ttk.Label(settings_frame, text="👁️ عند المراقبة:").pack(side=tk.RIGHT)
+        
         # الأزرار
         actions_frame = ttk.Frame(main_frame)
         actions_frame.pack(fill=tk.X, pady=10)
@@ -493,6 +1694,18 @@ class EmailCleanerGUI:
                                     padx=18, pady=8, state=tk.DISABLED, cursor='hand2')
         self.export_btn.pack(side=tk.LEFT, padx=3)
         
+        self.watch_btn = tk.Button(actions_frame, text="👁️ مراقبة", command=self._toggle_watch,
+                                   bg=self.colors['warning'], fg='white',
+                                   font=('Segoe UI', 11, 'bold'), relief=tk.FLAT,
+                                   padx=18, pady=8, state=tk.DISABLED, cursor='hand2')
+        self.watch_btn.pack(side=tk.LEFT, padx=3)
+        
+        self.resume_btn = tk.Button(actions_frame, text="📂 استئناف", command=self._load_report,
+                                    bg=self.colors['accent'], fg='white',
+                                    font=('Segoe UI', 11, 'bold'), relief=tk.FLAT,
+                                    padx=18, pady=8, cursor='hand2')
+        self.resume_btn.pack(side=tk.LEFT, padx=3)
+        
         # شريط التقدم
         progress_frame = ttk.Frame(main_frame)
         progress_frame.pack(fill=tk.X, pady=5)
@@ -549,6 +1762,14 @@ class EmailCleanerGUI:
         self.progress_label.config(text=message)
         self.root.update_idletasks()
     
+    def _load_rules(self):
+        filepath = filedialog.askopenfilename(filetypes=[("JSON", "*.json")])
+        if filepath:
+            success, message = self.core.load_rules(filepath)
+            self._log(message)
+            if not success:
+                messagebox.showerror("خطأ", message)
+    
     def _connect(self):
         email_addr = self.email_var.get().strip()
         password = self.pass_var.get().strip()
@@ -575,6 +1796,7 @@ class EmailCleanerGUI:
             self.connect_btn.config(state=tk.DISABLED)
             self.disconnect_btn.config(state=tk.NORMAL)
             self.scan_btn.config(state=tk.NORMAL)
+            self.watch_btn.config(state=tk.NORMAL)
             self.email_entry.config(state=tk.DISABLED)
             self.pass_entry.config(state=tk.DISABLED)
             self._log("✅ يمكنك الآن فحص البريد")
@@ -585,12 +1807,14 @@ class EmailCleanerGUI:
             self._log("   https://myaccount.google.com/apppasswords")
     
     def _disconnect(self):
+        self._stop_watch()
         self.core.disconnect()
         self.is_connected = False
         self.status_label.config(text="⚪ غير متصل", foreground=self.colors['fg'])
         self.connect_btn.config(state=tk.NORMAL)
         self.disconnect_btn.config(state=tk.DISABLED)
         self.scan_btn.config(state=tk.DISABLED)
+        self.watch_btn.config(state=tk.DISABLED)
         self.delete_btn.config(state=tk.DISABLED)
         self.unsub_btn.config(state=tk.DISABLED)
         self.export_btn.config(state=tk.DISABLED)
@@ -605,14 +1829,35 @@ class EmailCleanerGUI:
         days = int(self.days_var.get())
         limit = int(self.limit_var.get())
         
+        report = None
+        if self.stream_var.get():
+            filepath = filedialog.asksaveasfilename(
+                defaultextension=".jsonl",
+                filetypes=self.REPORT_FILETYPES,
+                initialfile=f"email_report_{datetime.now().strftime('%Y%m%d_%H%M')}.jsonl"
+            )
+            if not filepath:
+                return
+            try:
+                report = open_report(filepath)
+            except (OSError, ValueError, sqlite3.Error) as e:
+                messagebox.showerror("خطأ", f"تعذر إنشاء التقرير: {str(e)}")
+                return
+        
         self._log(f"🔍 فحص البريد (آخر {days} يوم)...", clear=True)
         self.scan_btn.config(state=tk.DISABLED)
         
         def do_scan():
-            messages = self.core.scan_inbox(
-                days_back=days, limit=limit,
-                callback=lambda msg, prog: self.root.after(0, lambda: self._update_progress(msg, prog))
-            )
+            try:
+                messages = self.core.scan_inbox(
+                    days_back=days, limit=limit, report=report,
+                    callback=lambda msg, prog: self.root.after(0, lambda: self._update_progress(msg, prog))
+                )
+            finally:
+                if report:
+                    report.close(self.core._report_summary())
+            if report:
+                self.root.after(0, lambda: self._log(f"💾 تم حفظ التقرير: {report.filepath}"))
             self.root.after(0, lambda: self._on_scan_complete(messages))
         
         threading.Thread(target=do_scan, daemon=True).start()
@@ -698,17 +1943,65 @@ class EmailCleanerGUI:
     
     def _export_report(self):
         filepath = filedialog.asksaveasfilename(
-            defaultextension=".json",
-            filetypes=[("JSON", "*.json")],
-            initialfilename=f"email_report_{datetime.now().strftime('%Y%m%d_%H%M')}.json"
+            defaultextension=".jsonl",
+            filetypes=self.REPORT_FILETYPES + [self.SUMMARY_FILETYPE],
+            initialfile=f"email_report_{datetime.now().strftime('%Y%m%d_%H%M')}.jsonl"
         )
         
         if filepath:
-            count = self.core.export_results(filepath)
+            try:
+                count = self.core.export_results(filepath)
+            except (OSError, ValueError, sqlite3.Error) as e:
+                messagebox.showerror("خطأ", f"فشل التصدير: {str(e)}")
+                return
             self._log(f"\n📄 تم التصدير: {filepath}")
             messagebox.showinfo("نجاح", f"تم التصدير ({count} رابط)")
     
+    def _load_report(self):
+        filepath = filedialog.askopenfilename(filetypes=self.REPORT_FILETYPES)
+        if not filepath:
+            return
+        
+        success, message = self.core.load_results(filepath)
+        self._log(message, clear=success)
+        if success:
+            self._on_scan_complete(self.core.messages)
+            # الحذف والفحص يحتاجان اتصالاً؛ إلغاء الاشتراك والتصدير لا
+            state = tk.NORMAL if self.is_connected else tk.DISABLED
+            self.scan_btn.config(state=state)
+            if not self.is_connected:
+                self.delete_btn.config(state=state)
+        else:
+            messagebox.showerror("خطأ", message)
+    
+    def _toggle_watch(self):
+        if self.watcher and self.watcher.is_running:
+            self._stop_watch()
+            return
+        
+        actions = dict(self.WATCH_ACTIONS).get(self.watch_action_var.get(), [])
+        if 'delete' in actions and not messagebox.askyesno(
+                "تأكيد", "⚠️ سيتم حذف الرسائل الدعائية الجديدة فور وصولها. متابعة؟", icon='warning'):
+            return
+        
+        self.watcher = InboxWatcher(
+            self.core, self.email_var.get().strip(), self.pass_var.get().strip(),
+            actions=actions,
+            callback=lambda msg: self.root.after(0, lambda: self._log(msg))
+        )
+        self.watcher.start()
+        self.watch_btn.config(text="⏹️ إيقاف المراقبة")
+        if 'unsubscribe' in actions:
+            self.unsub_btn.config(state=tk.NORMAL)
+    
+    def _stop_watch(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+        self.watch_btn.config(text="👁️ مراقبة")
+    
     def _on_closing(self):
+        self._stop_watch()
         if self.is_connected:
             self.core.disconnect()
         self.root.destroy()
@@ -717,8 +2010,85 @@ class EmailCleanerGUI:
         self.root.mainloop()
 
 
+def _watch_password(email_address: str, single: bool) -> str:
+    """كلمة مرور الحساب من EMAIL_CLEANER_PASSWORD_<الحساب> أو بإدخالها"""
+    # مثال: EMAIL_CLEANER_PASSWORD_USER_GMAIL_COM؛ المتغير العام يُقبل مع حساب واحد فقط
+    account = re.sub(r'[^A-Z0-9]', '_', email_address.upper())
+    password = os.environ.get(f'EMAIL_CLEANER_PASSWORD_{account}')
+    if not password and single:
+        password = os.environ.get('EMAIL_CLEANER_PASSWORD')
+    return password or getpass.getpass(f"🔑 {email_address}: ")
+
+
+def watch(args):
+    """وضع المراقبة المستمرة دون واجهة رسومية"""
+    core = EmailCleanerCore()
+    if args.rules:
+        print(core.load_rules(args.rules)[1])
+    
+    report = open_report(args.report) if args.report else None
+    if report:
+        report.begin({"scan_date": datetime.now().isoformat(), "accounts": [a.lower() for a in args.watch]})
+    
+    watchers = []
+    for email_address in args.watch:
+        password = _watch_password(email_address, single=len(args.watch) == 1)
+        watcher = InboxWatcher(core, email_address, password, actions=args.action,
+                               move_to=args.move_to, report=report,
+                               callback=lambda msg: print(f"[{datetime.now():%H:%M:%S}] {msg}", flush=True))
+        watcher.start()
+        watchers.append(watcher)
+    
+    # auto_unsubscribe يعيد نتائج الدفعة الأخيرة فقط، فتُجمع هنا لملخص التقرير
+    unsubscribe_results: Dict[str, str] = {}
+    try:
+        while any(w.is_running for w in watchers):
+            time.sleep(60)
+            if report:
+                report.flush()
+            if core.unsubscribe_queue and REQUESTS_AVAILABLE:
+                for sender, result in core.auto_unsubscribe().items():
+                    unsubscribe_results[sender] = result
+                    print(f"🚫 {sender}: {result}", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for watcher in watchers:
+            watcher.stop()
+        for watcher in watchers:
+            watcher.join(timeout=10)
+        if report:
+            report.close({"unsubscribe_results": unsubscribe_results})
+
+
 def main():
-    app = EmailCleanerGUI()
+    parser = argparse.ArgumentParser(description=f"{__title__} v{__version__}")
+    parser.add_argument('--rules', help="ملف قواعد التقييم (JSON)")
+    parser.add_argument('--benchmark-rules', action='store_true',
+                        help="قياس زمن تقييم الرسالة الواحدة ثم الخروج")
+    parser.add_argument('--watch', action='append', metavar='EMAIL',
+                        help="مراقبة الحساب دون واجهة (يمكن تكراره لعدة حسابات)")
+    parser.add_argument('--action', action='append', choices=InboxWatcher.ACTIONS,
+                        help="الإجراء على الرسائل الدعائية الجديدة (يمكن تكراره)")
+    parser.add_argument('--move-to', default='Promotions', help="مجلد النقل")
+    parser.add_argument('--report', help="كتابة الرسائل المكتشفة أثناء المراقبة (.jsonl / .csv / .gz / .db)")
+    args = parser.parse_args()
+    
+    if args.benchmark_rules:
+        core = EmailCleanerCore()
+        if args.rules:
+            print(core.load_rules(args.rules)[1])
+        result = core.scoring.benchmark()
+        print(f"extract: {result['extract']:.2f} µs/message")
+        print(f"score:   {result['score']:.2f} µs/message")
+        print(f"total:   {result['extract'] + result['score']:.2f} µs/message")
+        return
+    
+    if args.watch:
+        watch(args)
+        return
+    
+    app = EmailCleanerGUI(rules_file=args.rules)
     app.run()
 
 